@@ -1,17 +1,60 @@
 import os
+import struct
 import sys
-from PIL import Image, ImageDraw, ImageFont
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from PIL import Image, ImageColor, ImageDraw, ImageFont
 import piexif
 from datetime import datetime
 
-def get_date_info(image_path):
-    """获取图片拍摄日期，没有EXIF就用文件创建日期"""
+try:
+    # 可选依赖（pip install exifread）：读到 DateTime 标签即停止解析各 IFD，且不解码 MakerNote、不提取缩略图
+    import exifread
+except ImportError:
+    exifread = None
+
+# JPEG 的 EXIF(APP1) 位于文件开头，读取前 128KB 通常就足够
+EXIF_HEAD_SIZE = 128 * 1024
+JPEG_SIGNATURE = b"\xff\xd8"
+TIFF_SIGNATURES = (b"II*\x00", b"MM\x00*")
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+def load_exif(image_path, head):
+    """用 piexif 读取 EXIF 数据；JPEG 只解析已读取的文件头部"""
+    if head.startswith(JPEG_SIGNATURE):
+        try:
+            return piexif.load(head)
+        except (piexif.InvalidImageDataError, struct.error, ValueError):
+            pass  # 头部不足以容纳所有元数据段（截断处可能落在段头中间），回退到读取整个文件
+    return piexif.load(image_path)
+
+def read_exif_datetime(image_path):
+    """读取 EXIF 中的 DateTime 字符串（如 2023:05:01 10:00:00），没有则返回 None"""
+    with open(image_path, "rb") as f:
+        head = f.read(EXIF_HEAD_SIZE)
+        # 只有 JPEG/TIFF 才解析 EXIF；PNG 等其他格式很少带 EXIF，直接使用文件日期
+        if not head.startswith((JPEG_SIGNATURE,) + TIFF_SIGNATURES):
+            return None
+        if exifread is not None:
+            try:
+                f.seek(0)
+                tags = exifread.process_file(f, stop_tag="DateTime", details=False, extract_thumbnail=False)
+                tag = tags.get("Image DateTime")
+                return str(tag) if tag else None
+            except Exception:
+                pass  # exifread 解析失败时回退到 piexif
+
+    date_str = load_exif(image_path, head)["0th"].get(piexif.ImageIFD.DateTime, None)
+    return date_str.decode('utf-8') if date_str else None
+
+def get_date_info(image_path, entry=None):
+    """获取图片拍摄日期，没有EXIF就用文件创建日期
+
+    entry 为 os.scandir 返回的 DirEntry 时，复用其 stat 结果获取创建日期
+    """
     # 先尝试从 EXIF 获取
     try:
-        exif_data = piexif.load(image_path)
-        date_str = exif_data["0th"].get(piexif.ImageIFD.DateTime, None)
+        date_str = read_exif_datetime(image_path)
         if date_str:
-            date_str = date_str.decode('utf-8')
             date_obj = datetime.strptime(date_str, "%Y:%m:%d %H:%M:%S")
             return date_obj.strftime("%Y-%m-%d")
     except Exception:
@@ -19,34 +62,29 @@ def get_date_info(image_path):
 
     # 如果没有EXIF日期，返回文件创建日期
     try:
-        ctime = os.path.getctime(image_path)
+        ctime = entry.stat().st_ctime if entry is not None else os.path.getctime(image_path)
         return datetime.fromtimestamp(ctime).strftime("%Y-%m-%d")
     except Exception:
         return None
 
-def add_watermark(image_path, text, font_size, color, position, output_dir):
-    """在图片上添加水印"""
+def load_font(font_size):
+    """加载水印字体，整个批次只加载一次"""
     try:
-        img = Image.open(image_path).convert("RGBA")
-    except Exception as e:
-        print(f"无法打开 {image_path}: {e}")
-        return
+        return ImageFont.truetype("arial.ttf", font_size)
+    except:
+        return ImageFont.load_default()
 
-    txt_layer = Image.new("RGBA", img.size, (255,255,255,0))
-    draw = ImageDraw.Draw(txt_layer)
+def add_watermark(image_path, text, font, color, position, output_dir):
+    """在图片上添加水印，返回保存路径；打开或保存失败时抛出异常，由调用方统一输出"""
+    img = Image.open(image_path)
+    img.load()
 
-    # 选择字体
-    try:
-        font = ImageFont.truetype("arial.ttf", font_size)
-    except:
-        font = ImageFont.load_default()
+    # 带透明通道的图片需要把文字合成到源 alpha 上，其余图片保持 RGB 直接在原图上绘制
+    has_alpha = "A" in img.mode or "transparency" in img.info
 
-    try:
-        bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
-    except AttributeError:
-        text_width, text_height = draw.textsize(text, font=font)
+    bbox = font.getbbox(text)
+    text_width = bbox[2] - bbox[0]
+    text_height = bbox[3] - bbox[1]
 
     # 位置映射
     pos_map = {
@@ -57,14 +95,30 @@ def add_watermark(image_path, text, font_size, color, position, output_dir):
     pos = pos_map.get(position, pos_map["right_bottom"])
 
     # 画文字
-    draw.text(pos, text, font=font, fill=color)
-    watermarked = Image.alpha_composite(img, txt_layer).convert("RGB")
+    rgba = ImageColor.getcolor(color, "RGBA")
+    if has_alpha:
+        # 文字与半透明像素混合的结果取决于源 alpha，这类图片沿用整图 RGBA 合成
+        img = img.convert("RGBA")
+        txt_layer = Image.new("RGBA", img.size, (255, 255, 255, 0))
+        ImageDraw.Draw(txt_layer).text(pos, text, font=font, fill=rgba)
+        img = Image.alpha_composite(img, txt_layer).convert("RGB")
+    else:
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        if rgba[3] == 255:
+            ImageDraw.Draw(img).text(pos, text, font=font, fill=rgba[:3])
+        else:
+            # Pillow 绘制文字时不使用填充色的 alpha，半透明颜色先画到文字大小的蒙版上再按蒙版填色
+            mask = Image.new("L", (text_width, text_height), 0)
+            ImageDraw.Draw(mask).text((-bbox[0], -bbox[1]), text, font=font, fill=rgba[3])
+            left, top = pos[0] + bbox[0], pos[1] + bbox[1]
+            img.paste(rgba[:3], (left, top, left + text_width, top + text_height), mask)
 
     # 保存
     os.makedirs(output_dir, exist_ok=True)
     save_path = os.path.join(output_dir, os.path.basename(image_path))
-    watermarked.save(save_path)
-    print(f"已保存: {save_path}")
+    img.save(save_path)
+    return save_path
 
 def main():
     if len(sys.argv) < 2:
@@ -81,15 +135,33 @@ def main():
     position = input("请输入位置(left_top/center/right_bottom): ")
 
     output_dir = folder + "_watermark"
+    font = load_font(font_size)
+
+    with os.scandir(folder) as it:
+        entries = [e for e in it if e.is_file() and os.path.splitext(e.name)[1].lower() in IMAGE_EXTENSIONS]
+
+    tasks = []
+    for entry in entries:
+        date_text = get_date_info(entry.path, entry)
+        if date_text:
+            tasks.append((entry.path, date_text))
+        else:
+            print(f"跳过 {entry.name}: 无日期信息")
 
-    for filename in os.listdir(folder):
-        if filename.lower().endswith((".jpg", ".jpeg", ".png")):
-            path = os.path.join(folder, filename)
-            date_text = get_date_info(path)
-            if date_text:
-                add_watermark(path, date_text, font_size, color, position, output_dir)
+    # 多线程处理：Pillow 解码/编码时会释放 GIL，各任务输出路径互不相同，无需加锁
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = {
+            executor.submit(add_watermark, path, date_text, font, color, position, output_dir): path
+            for path, date_text in tasks
+        }
+        # 进度只在主线程输出，工作线程不再争用 stdout
+        for future in as_completed(futures):
+            try:
+                save_path = future.result()
+            except Exception as e:
+                print(f"无法处理 {futures[future]}: {e}")
             else:
-                print(f"跳过 {filename}: 无日期信息")
+                print(f"已保存: {save_path}")
 
 if __name__ == "__main__":
     main()
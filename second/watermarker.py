@@ -3,37 +3,382 @@
 """
 Watermarker 本地应用（单文件 PyQt5 实现）
 中文界面版本（支持水印拖拽功能）
+
+依赖：PyQt5、Pillow。Pillow 官方 wheel 已链接 libjpeg-turbo；可改装 pillow-simd，用 SIMD 加速缩放和滤镜：
+    pip uninstall Pillow
+    pip install pillow-simd
 """
 
 import sys
 import os
 import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
 from PIL import Image, ImageDraw, ImageFont
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QFileDialog, QListWidget, QLabel, QPushButton,
     QHBoxLayout, QVBoxLayout, QListWidgetItem, QSlider, QColorDialog,
     QLineEdit, QComboBox, QSpinBox, QMessageBox, QCheckBox, QInputDialog
 )
-from PyQt5.QtGui import QPixmap, QImage, QDragEnterEvent, QDropEvent, QFontDatabase, QCursor,QIcon
-from PyQt5.QtCore import Qt, QPoint
+from PyQt5.QtGui import QPixmap, QImage, QDragEnterEvent, QDropEvent, QCloseEvent, QFontDatabase, QCursor,QIcon
+from PyQt5.QtCore import Qt, QPoint, QObject, QRunnable, QThread, QThreadPool, QTimer, pyqtSignal
 
 # -------------------- 辅助函数 --------------------
-def pil_image_to_qpixmap(im):
+def _qimage_from_pil(im):
+    """返回 (qimg, data)：qimg 只引用 data 缓冲区，使用期间 data 必须保持存活"""
+    # RGB 图片直接按 RGB888 交给 QImage，避免先整图转换成 RGBA
+    if im.mode == 'RGB':
+        data = im.tobytes('raw', 'RGB')
+        return QImage(data, im.width, im.height, im.width * 3, QImage.Format_RGB888), data
     if im.mode != 'RGBA':
         im = im.convert('RGBA')
     data = im.tobytes('raw', 'RGBA')
-    qimg = QImage(data, im.width, im.height, QImage.Format_RGBA8888)
+    return QImage(data, im.width, im.height, im.width * 4, QImage.Format_RGBA8888), data
+
+
+def pil_image_to_qpixmap(im):
+    qimg, data = _qimage_from_pil(im)
     return QPixmap.fromImage(qimg)
 
 
-def load_image_thumbnail(path, max_size=(160, 120)):
+def pil_image_to_qimage(im):
+    """返回自带像素数据的 QImage，可在后台线程中生成（QPixmap 只能在界面线程使用）"""
+    qimg, data = _qimage_from_pil(im)
+    return qimg.copy()
+
+
+@lru_cache(maxsize=32)
+def load_font(font_family, font_size):
+    """按字体名和字号缓存字体对象，避免每次渲染都重新解析字体文件"""
+    try:
+        # 尝试使用 PIL 的 truetype 字体
+        return ImageFont.truetype(font_family, font_size)
+    except Exception:
+        # 回退到默认字体
+        return ImageFont.load_default()
+
+
+def load_thumbnail_qimage(path, max_size=(160, 120)):
     try:
         im = Image.open(path)
-        im.thumbnail(max_size)
-        return pil_image_to_qpixmap(im)
+        # JPEG 解码时直接按 DCT 缩放输出小图，避免解码全分辨率
+        im.draft('RGB', (max_size[0] * 2, max_size[1] * 2))
+        im.thumbnail(max_size, Image.Resampling.BILINEAR)
+        return pil_image_to_qimage(im)
     except Exception as e:
         print('load thumbnail error', e)
-        return QPixmap()
+        return QImage()
+
+
+def load_image_thumbnail(path, max_size=(160, 120)):
+    return QPixmap.fromImage(load_thumbnail_qimage(path, max_size))
+
+
+class ThumbnailSignals(QObject):
+    loaded = pyqtSignal(int, int, str, QImage)  # 批次号, 行号, 图片路径, 缩略图
+
+
+class ThumbnailTask(QRunnable):
+    """在线程池中解码列表缩略图，完成后通过信号交回界面线程设置图标"""
+
+    def __init__(self, generation, row, path, signals):
+        super().__init__()
+        self.generation = generation
+        self.row = row
+        self.path = path
+        self.signals = signals
+
+    def run(self):
+        self.signals.loaded.emit(self.generation, self.row, self.path, load_thumbnail_qimage(self.path, (64, 48)))
+
+
+# -------------------- 水印渲染 & 导出 --------------------
+@lru_cache(maxsize=32)
+def parse_color(color):
+    """把 '#RRGGBB' 解析为 (r, g, b) 并缓存，解析失败时回退为白色"""
+    try:
+        return tuple(int(color.lstrip('#')[i:i + 2], 16) for i in (0, 2, 4))
+    except Exception:
+        return (255, 255, 255)
+
+
+@lru_cache(maxsize=16)
+def render_text_tile(text, font_family, font_size, rgb, opacity, shadow, ratio=1.0):
+    """渲染只包含文字（及阴影）的小图层并缓存，调用方不得修改返回的图层
+
+    返回 (tile, text_size)：图层左上角即文字外框左上角，text_size 为文字外框尺寸，用于计算位置；
+    ratio 不为 1 时按原字号渲染后再整体缩放，字体回退为固定大小的默认字体时预览也与导出一致
+    """
+    font = load_font(font_family, font_size)
+    # 用 font.getbbox 测量文字外框（Pillow 10 已移除 draw.textsize）
+    left, top, right, bottom = font.getbbox(text)
+    txt_w, txt_h = right - left, bottom - top
+
+    # 图层在文字外框基础上留出阴影偏移
+    tile = Image.new('RGBA', (txt_w + 2, txt_h + 2), (255, 255, 255, 0))
+    draw = ImageDraw.Draw(tile)
+
+    # 阴影
+    if shadow:
+        shadow_color = (0, 0, 0, int(opacity * 0.6))
+        draw.text((2 - left, 2 - top), text, font=font, fill=shadow_color)
+
+    # 文字本体
+    draw.text((-left, -top), text, font=font, fill=rgb + (int(255 * opacity / 100),))
+    if ratio != 1.0:
+        tile = tile.resize((max(1, round(tile.width * ratio)), max(1, round(tile.height * ratio))),
+                           Image.Resampling.BILINEAR)
+        txt_w, txt_h = round(txt_w * ratio), round(txt_h * ratio)
+    return tile, (txt_w, txt_h)
+
+
+def composite_tile(im, tile, pos):
+    """把 RGBA 小图层合成到 im 的 pos 处（原地修改），只处理重叠区域，允许超出边界"""
+    x, y = pos
+    left, top = max(x, 0), max(y, 0)
+    right, bottom = min(x + tile.width, im.width), min(y + tile.height, im.height)
+    if left >= right or top >= bottom:
+        return
+    part = tile.crop((left - x, top - y, right - x, bottom - y))
+    if im.mode == 'RGBA':
+        im.alpha_composite(part, (left, top))
+    else:
+        im.paste(part, (left, top), part)
+
+
+@lru_cache(maxsize=16)
+def load_image_watermark(wm_path, new_w, new_h, alpha):
+    """加载、缩放并调整透明度后的图片水印，按参数缓存，调用方不得修改返回的图片"""
+    wm = Image.open(wm_path).convert('RGBA')
+    wm = wm.resize((new_w, new_h), Image.Resampling.LANCZOS)
+
+    # 混合透明度
+    if alpha < 255:
+        # 8 位通道的 point 本质是查表，直接给出 256 项查找表；getchannel 只取 alpha，不拆分全部通道
+        lut = [round(p * alpha / 255) for p in range(256)]
+        wm.putalpha(wm.getchannel('A').point(lut))
+
+    # 保持原有观感：原实现把水印按自身 alpha 贴到透明白色图层上再合成（alpha 叠加两次并带白边）
+    layer = Image.new('RGBA', wm.size, (255, 255, 255, 0))
+    layer.paste(wm, (0, 0), wm)
+    return layer
+
+
+def image_size(path):
+    """只读取文件头获取图片尺寸，失败时返回 (0, 0)"""
+    try:
+        with Image.open(path) as im:
+            return im.size
+    except Exception:
+        return (0, 0)
+
+
+def working_mode(im):
+    """RGB/RGBA 保持原样；其他模式按是否带透明度转换为 RGBA 或 RGB"""
+    if im.mode in ('RGB', 'RGBA'):
+        return im.mode
+    return 'RGBA' if 'A' in im.mode or 'transparency' in im.info else 'RGB'
+
+
+def render_watermark(base_im, tpl, copy=True, ratio=1.0):
+    """按模板参数 tpl（即 _gather_template 的返回值）给图片加水印，不依赖 Qt
+
+    copy=False 时允许直接在 base_im 上绘制（导出时原图不再使用）；
+    ratio 为 base_im 相对原图的缩放比例，预览时在缩小后的图上按比例绘制水印
+    """
+    if base_im is None:
+        return None
+    mode = working_mode(base_im)
+    if base_im.mode != mode:
+        im = base_im.convert(mode)
+    else:
+        im = base_im.copy() if copy else base_im
+    w, h = im.size
+
+    # 文本水印
+    pos_key = tpl.get('position', 'center')
+    offsets = tpl.get('offset', (0, 0))  # 使用拖拽产生的偏移量
+    offsets = (round(offsets[0] * ratio), round(offsets[1] * ratio))
+    margin = round(10 * ratio)
+    tile, (txt_w, txt_h) = render_text_tile(
+        tpl.get('text', ''), tpl.get('font_family', 'Arial'), max(8, tpl.get('font_size', 36)),
+        parse_color(tpl.get('color', '#FFFFFF')), int(tpl.get('opacity', 70)), bool(tpl.get('shadow', True)),
+        ratio)
+
+    # 计算位置
+    x = 0;
+    y = 0
+    if pos_key == 'top-left':
+        x, y = margin, margin
+    elif pos_key == 'top':
+        x, y = (w - txt_w) // 2, margin
+    elif pos_key == 'top-right':
+        x, y = w - txt_w - margin, margin
+    elif pos_key == 'left':
+        x, y = margin, (h - txt_h) // 2
+    elif pos_key == 'center':
+        x, y = (w - txt_w) // 2, (h - txt_h) // 2
+    elif pos_key == 'right':
+        x, y = w - txt_w - margin, (h - txt_h) // 2
+    elif pos_key == 'bottom-left':
+        x, y = margin, h - txt_h - margin
+    elif pos_key == 'bottom':
+        x, y = (w - txt_w) // 2, h - txt_h - margin
+    elif pos_key == 'bottom-right':
+        x, y = w - txt_w - margin, h - txt_h - margin
+    x += offsets[0];
+    y += offsets[1]  # 应用偏移量
+
+    # 只在文字所在区域合成，不再对整张图做 alpha 混合
+    composite_tile(im, tile, (x, y))
+
+    # 图片水印
+    if tpl.get('image_watermark'):
+        try:
+            scale = max(0.01, tpl.get('image_scale', 0.25)) * ratio
+            wm_w, wm_h = image_size(tpl['image_watermark'])
+            new_w = int(wm_w * scale)
+            new_h = int(wm_h * scale)
+            if new_w <= 0 or new_h <= 0:
+                new_w, new_h = int(w * 0.25), int(h * 0.25)
+            alpha = int(tpl.get('image_opacity', 80) * 255 / 100)
+            wm = load_image_watermark(tpl['image_watermark'], new_w, new_h, alpha)
+
+            # 计算图片水印位置（考虑偏移量）
+            wx, wy = 0, 0
+            if pos_key == 'top-left':
+                wx, wy = margin, margin
+            elif pos_key == 'top':
+                wx, wy = (w - new_w) // 2, margin
+            elif pos_key == 'top-right':
+                wx, wy = w - new_w - margin, margin
+            elif pos_key == 'left':
+                wx, wy = margin, (h - new_h) // 2
+            elif pos_key == 'center':
+                wx, wy = (w - new_w) // 2, (h - new_h) // 2
+            elif pos_key == 'right':
+                wx, wy = w - new_w - margin, (h - new_h) // 2
+            elif pos_key == 'bottom-left':
+                wx, wy = margin, h - new_h - margin
+            elif pos_key == 'bottom':
+                wx, wy = (w - new_w) // 2, h - new_h - margin
+            elif pos_key == 'bottom-right':
+                wx, wy = w - new_w - margin, h - new_h - margin
+            wx += offsets[0];
+            wy += offsets[1]  # 应用偏移量
+
+            composite_tile(im, wm, (wx, wy))
+        except Exception as e:
+            print('加载图片水印失败', e)
+
+    return im
+
+
+def resize_image(im, resize_spec):
+    """按导出缩放设置 (mode, value) 缩放图片"""
+    mode, value = resize_spec
+    if mode == '按宽度':
+        new_w = int(value)
+        ratio = new_w / im.width
+        new_h = int(im.height * ratio)
+        im = im.resize((new_w, new_h), Image.Resampling.LANCZOS)
+    elif mode == '按高度':
+        new_h = int(value)
+        ratio = new_h / im.height
+        new_w = int(im.width * ratio)
+        im = im.resize((new_w, new_h), Image.Resampling.LANCZOS)
+    elif mode == '按百分比':
+        pct = int(value)
+        new_w = int(im.width * pct / 100.0)
+        new_h = int(im.height * pct / 100.0)
+        im = im.resize((new_w, new_h), Image.Resampling.LANCZOS)
+    return im
+
+
+def build_output_name(path, naming):
+    """按命名规则 (rule, add) 生成导出文件名"""
+    rule, add = naming
+    base_name = os.path.basename(path)
+    name, ext = os.path.splitext(base_name)
+    if rule.startswith('保留'):
+        return name + ext
+    elif rule.startswith('添加前缀'):
+        return add + name + ext
+    else:
+        return name + add + ext
+
+
+def _export_one(path, template, resize_spec, naming, quality, output_folder):
+    """导出单张图片，在子进程中运行，参数均按值传入"""
+    # 保持解码后的原始模式（JPEG 为 RGB），不做整图 RGBA 转换
+    base = Image.open(path)
+    base.load()
+    out = render_watermark(base, template, copy=False)
+    out = resize_image(out, resize_spec)
+
+    # 输出路径
+    out_path = os.path.join(output_folder, build_output_name(path, naming))
+    # 真正的 JPEG 原图解码为 RGB，直接保存；带透明通道的图片（如扩展名为 .jpg 的 PNG）仍合并到白色背景上
+    if os.path.splitext(path)[1].lower() in ('.jpg', '.jpeg'):
+        if out.mode == 'RGBA':
+            bg = Image.new('RGB', out.size, (255, 255, 255))
+            bg.paste(out, mask=out.getchannel('A'))
+            out = bg
+        elif out.mode != 'RGB':
+            out = out.convert('RGB')
+        # 以下参数与 Pillow 默认值相同，仅显式写出
+        save_kwargs = {'quality': quality, 'optimize': False, 'progressive': False}
+        if quality < 90:
+            save_kwargs['subsampling'] = 2  # 4:2:0 色度抽样
+        out.save(out_path, **save_kwargs)
+    elif os.path.splitext(path)[1].lower() == '.png':
+        out.save(out_path, compress_level=1)  # 最快的 zlib 压缩级别，导出大图时明显更快
+    else:
+        out.save(out_path)
+    return out_path
+
+
+class ExportWorker(QThread):
+    """后台导出线程：把每张图片提交到进程池，并通过信号回报进度"""
+    progress = pyqtSignal(int, int, str)  # 已完成数, 总数, 输出路径
+    failed = pyqtSignal(str, str)  # 源图片路径, 错误信息
+
+    def __init__(self, paths, template, resize_spec, naming, quality, output_folder, parent=None):
+        super().__init__(parent)
+        self.paths = list(paths)
+        self.template = template
+        self.resize_spec = resize_spec
+        self.naming = naming
+        self.quality = quality
+        self.output_folder = output_folder
+        self.cancelled = False
+
+    def cancel(self):
+        """请求取消导出：尚未开始的图片不再处理，正在处理的图片完成后线程退出"""
+        self.cancelled = True
+
+    def run(self):
+        total = len(self.paths)
+        # 使用 spawn 启动子进程：界面进程是多线程的，fork 出的子进程可能继承被占用的锁而死锁；
+        # 每个子进程都要重新导入 PyQt5，进程数不超过图片数
+        mp_context = multiprocessing.get_context('spawn')
+        max_workers = min(total, os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context) as executor:
+            futures = {
+                executor.submit(_export_one, p, self.template, self.resize_spec,
+                                self.naming, self.quality, self.output_folder): p
+                for p in self.paths
+            }
+            for idx, future in enumerate(as_completed(futures), start=1):
+                if self.cancelled:
+                    # 取消排队中的任务；退出 with 时等待正在运行的子进程结束，不留下孤儿进程
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    break
+                try:
+                    self.progress.emit(idx, total, future.result())
+                except Exception as e:
+                    self.failed.emit(futures[future], str(e))
 
 
 # -------------------- 主窗口 --------------------
@@ -46,10 +391,18 @@ class Watermarker(QWidget):
 
         # 数据
         self.image_paths = []
+        self.image_paths_set = set()  # 与 image_paths 同步，用于 O(1) 去重
         self.current_index = None
         self.current_image = None  # PIL Image
         self.preview_pixmap = None  # 当前预览的QPixmap（用于鼠标位置计算）
         self.preview_scale_ratio = 1.0  # 预览图与原图的缩放比例（关键：转换鼠标坐标用）
+        self.preview_base = None  # 缩放到预览区大小的当前图片（预览时在它上面绘制水印）
+        self.preview_base_size = None
+
+        # 预览节流：拖动滑块/输入文字时合并短时间内的多次刷新
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.timeout.connect(self._do_update_preview)
 
         # 水印拖拽相关状态
         self.is_dragging = False  # 是否正在拖拽水印
@@ -222,8 +575,18 @@ class Watermarker(QWidget):
         self.img_opacity_slider.valueChanged.connect(self.update_preview)
         self.list_widget.setAcceptDrops(True)
 
+        # 列表缩略图：先用占位图标，再由线程池在后台解码；清空列表时批次号递增，丢弃旧批次的结果
+        placeholder = QPixmap(64, 48)
+        placeholder.fill(Qt.transparent)
+        self.placeholder_icon = QIcon(placeholder)
+        self.thumbnail_pool = QThreadPool(self)
+        self.thumbnail_signals = ThumbnailSignals(self)
+        self.thumbnail_signals.loaded.connect(self.on_thumbnail_loaded)
+        self.thumbnail_generation = 0
+
         # 输出
         self.output_folder = None
+        self.export_worker = None  # 后台导出线程
 
     def _populate_fonts(self):
         db = QFontDatabase()
@@ -262,33 +625,52 @@ class Watermarker(QWidget):
 
     def add_files(self, paths):
         accepted_ext = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+        rows = []
         for p in paths:
             if os.path.isdir(p):
                 for root, _, fnames in os.walk(p):
                     for f in fnames:
                         if f.lower().endswith(accepted_ext):
-                            self._add_image(os.path.join(root, f))
+                            rows.append(self._add_image(os.path.join(root, f)))
             else:
                 if p.lower().endswith(accepted_ext):
-                    self._add_image(p)
+                    rows.append(self._add_image(p))
         self.update()
 
+        # 列表项已全部加入，缩略图交给线程池在后台解码
+        for row in rows:
+            if row is not None:
+                task = ThumbnailTask(self.thumbnail_generation, row, self.image_paths[row], self.thumbnail_signals)
+                self.thumbnail_pool.start(task)
+
     def _add_image(self, path):
-        if path in self.image_paths:
-            return
+        """加入列表并返回所在行号，已存在时返回 None"""
+        if path in self.image_paths_set:
+            return None
+        self.image_paths_set.add(path)
         self.image_paths.append(path)
         item = QListWidgetItem(os.path.basename(path))
         item.setData(Qt.UserRole, path)
-        pixmap = QPixmap(path)
-        icon = QIcon(pixmap)
-        item.setIcon(icon)
+        item.setIcon(self.placeholder_icon)
         self.list_widget.addItem(item)
+        return len(self.image_paths) - 1
+
+    def on_thumbnail_loaded(self, generation, row, path, qimg):
+        if generation != self.thumbnail_generation:
+            return
+        item = self.list_widget.item(row)
+        if item is not None and item.data(Qt.UserRole) == path and not qimg.isNull():
+            item.setIcon(QIcon(QPixmap.fromImage(qimg)))
 
     def clear_list(self):
+        self.thumbnail_pool.clear()  # 丢弃尚未开始的缩略图任务
+        self.thumbnail_generation += 1
         self.image_paths = []
+        self.image_paths_set = set()
         self.list_widget.clear()
         self.preview_label.setPixmap(QPixmap())
         self.current_image = None
+        self.preview_base = None
         self.preview_pixmap = None
         self.template['offset'] = (0, 0)  # 清空列表时重置偏移量
 
@@ -301,9 +683,13 @@ class Watermarker(QWidget):
     def load_current_image(self):
         if self.current_index is None: return
         path = self.image_paths[self.current_index]
+        self.preview_base = None  # 换图后需重新生成缩小的底图
         try:
-            im = Image.open(path).convert('RGBA')
-            self.current_image = im
+            # 保持解码后的原始模式（JPEG 为 RGB），不做整图 RGBA 转换
+            im = Image.open(path)
+            im.load()
+            mode = working_mode(im)
+            self.current_image = im if im.mode == mode else im.convert(mode)
         except Exception as e:
             QMessageBox.warning(self, '加载图片失败', str(e))
             self.current_image = None
@@ -434,120 +820,15 @@ class Watermarker(QWidget):
             self.preview_label.setCursor(QCursor(Qt.ArrowCursor))  # 恢复鼠标样式
 
     # -------------------- 生成水印 & 预览 --------------------
-    def apply_watermark_to_pil(self, base_im: Image.Image) -> Image.Image:
-        if base_im is None:
-            return None
-        im = base_im.convert('RGBA').copy()
-        w, h = im.size
-
-        # 文本水印
-        text = self.input_text.text()
-        font_family = self.font_combo.currentText()
-        font_size = max(8, self.size_spin.value())
-        try:
-            # 尝试使用 PIL 的 truetype 字体
-            font = ImageFont.truetype(font_family, font_size)
-        except Exception:
-            # 回退到默认字体
-            font = ImageFont.load_default()
-
-        # 文字颜色与透明度
-        color = self.template.get('color', '#FFFFFF')
-        opacity = int(self.opacity_slider.value())
-
-        overlay = Image.new('RGBA', im.size, (255, 255, 255, 0))
-        draw = ImageDraw.Draw(overlay)
-
-        # 计算位置
-        txt_w, txt_h = draw.textsize(text, font=font)
-        pos_key = self.template.get('position', 'center')
-        offsets = self.template.get('offset', (0, 0))  # 使用拖拽产生的偏移量
-        x = 0;
-        y = 0
-        margin = 10
-        if pos_key == 'top-left':
-            x, y = margin, margin
-        elif pos_key == 'top':
-            x, y = (w - txt_w) // 2, margin
-        elif pos_key == 'top-right':
-            x, y = w - txt_w - margin, margin
-        elif pos_key == 'left':
-            x, y = margin, (h - txt_h) // 2
-        elif pos_key == 'center':
-            x, y = (w - txt_w) // 2, (h - txt_h) // 2
-        elif pos_key == 'right':
-            x, y = w - txt_w - margin, (h - txt_h) // 2
-        elif pos_key == 'bottom-left':
-            x, y = margin, h - txt_h - margin
-        elif pos_key == 'bottom':
-            x, y = (w - txt_w) // 2, h - txt_h - margin
-        elif pos_key == 'bottom-right':
-            x, y = w - txt_w - margin, h - txt_h - margin
-        x += offsets[0];
-        y += offsets[1]  # 应用偏移量
-
-        # 阴影
-        if self.shadow_cb.isChecked():
-            shadow_color = (0, 0, 0, int(opacity * 0.6))
-            draw.text((x + 2, y + 2), text, font=font, fill=shadow_color)
-
-        # 文字本体
-        try:
-            col = tuple(int(color.lstrip('#')[i:i + 2], 16) for i in (0, 2, 4)) + (int(255 * opacity / 100),)
-        except Exception:
-            col = (255, 255, 255, int(255 * opacity / 100))
-        draw.text((x, y), text, font=font, fill=col)
-
-        # 图片水印
-        if self.template.get('image_watermark'):
-            try:
-                wm = Image.open(self.template['image_watermark']).convert('RGBA')
-                scale = max(1, self.img_scale_slider.value()) / 100.0
-                new_w = int(wm.width * scale)
-                new_h = int(wm.height * scale)
-                if new_w <= 0 or new_h <= 0:
-                    new_w, new_h = int(w * 0.25), int(h * 0.25)
-                wm = wm.resize((new_w, new_h), Image.LANCZOS)
-
-                # 计算图片水印位置（考虑偏移量）
-                pos_key = self.template.get('position', 'center')
-                offsets = self.template.get('offset', (0, 0))
-                wx, wy = 0, 0
-                margin = 10
-                if pos_key == 'top-left':
-                    wx, wy = margin, margin
-                elif pos_key == 'top':
-                    wx, wy = (w - new_w) // 2, margin
-                elif pos_key == 'top-right':
-                    wx, wy = w - new_w - margin, margin
-                elif pos_key == 'left':
-                    wx, wy = margin, (h - new_h) // 2
-                elif pos_key == 'center':
-                    wx, wy = (w - new_w) // 2, (h - new_h) // 2
-                elif pos_key == 'right':
-                    wx, wy = w - new_w - margin, (h - new_h) // 2
-                elif pos_key == 'bottom-left':
-                    wx, wy = margin, h - new_h - margin
-                elif pos_key == 'bottom':
-                    wx, wy = (w - new_w) // 2, h - new_h - margin
-                elif pos_key == 'bottom-right':
-                    wx, wy = w - new_w - margin, h - new_h - margin
-                wx += offsets[0];
-                wy += offsets[1]  # 应用偏移量
-
-                # 混合透明度
-                alpha = int(self.img_opacity_slider.value() * 255 / 100)
-                if alpha < 255:
-                    alpha_mask = wm.split()[3].point(lambda p: p * alpha / 255)
-                    wm.putalpha(alpha_mask)
-                overlay.paste(wm, (wx, wy), wm)
-            except Exception as e:
-                print('加载图片水印失败', e)
-
-        out = Image.alpha_composite(im, overlay)
-        return out.convert('RGBA')
+    def apply_watermark_to_pil(self, base_im: Image.Image, ratio=1.0) -> Image.Image:
+        return render_watermark(base_im, self._gather_template(), ratio=ratio)
 
     def update_preview(self):
+        # 计时器未到期时不重复启动，保证拖动过程中约每 50ms 刷新一次
+        if not self.preview_timer.isActive():
+            self.preview_timer.start(50)
+
+    def _do_update_preview(self):
         if self.current_image is None:
             # 如果没有选中图片，尝试加载第一个
             if self.image_paths:
@@ -555,28 +836,34 @@ class Watermarker(QWidget):
                 self.load_current_image()
             else:
                 return
-
-        out = self.apply_watermark_to_pil(self.current_image)
-        if out is None: return
+        if self.current_image is None: return
 
         # 缩放以适应 QLabel
         label_w = self.preview_label.width()
         label_h = self.preview_label.height()
-        oh = out.height;
-        ow = out.width
+        oh = self.current_image.height;
+        ow = self.current_image.width
         self.preview_scale_ratio = min(label_w / ow, label_h / oh, 1)  # 保存缩放比例
-        disp = out.copy()
-        if self.preview_scale_ratio < 1:
-            disp = out.resize(
-                (int(ow * self.preview_scale_ratio), int(oh * self.preview_scale_ratio)),
-                Image.LANCZOS
-            )
+        disp_size = (max(1, int(ow * self.preview_scale_ratio)), max(1, int(oh * self.preview_scale_ratio)))
 
+        # 缩小后的底图只在换图或预览区尺寸变化时重新生成，水印直接画在缩小后的图上
+        # 预览尺度下 BILINEAR 与 LANCZOS 肉眼无差别且快得多，导出时仍使用 LANCZOS
+        if self.preview_base is None or self.preview_base_size != disp_size:
+            if self.preview_scale_ratio < 1:
+                self.preview_base = self.current_image.resize(disp_size, Image.Resampling.BILINEAR)
+            else:
+                self.preview_base = self.current_image
+            self.preview_base_size = disp_size
+
+        disp = self.apply_watermark_to_pil(self.preview_base, ratio=self.preview_scale_ratio)
         self.preview_pixmap = pil_image_to_qpixmap(disp)
         self.preview_label.setPixmap(self.preview_pixmap)
 
     # -------------------- 导出 --------------------
     def export_images(self):
+        if self.export_worker is not None and self.export_worker.isRunning():
+            QMessageBox.information(self, '正在导出', '上一次导出尚未完成，请稍候')
+            return
         if not self.image_paths:
             QMessageBox.warning(self, '没有图片', '请先导入图片后再导出')
             return
@@ -591,61 +878,45 @@ class Watermarker(QWidget):
                                     '导出目录与源图片目录相同，默认禁止覆盖。若确实需要，请勾选允许导出到原文件夹。')
                 return
 
-        naming = self.naming_combo.currentText()
-        add = self.naming_input.text()
+        naming = (self.naming_combo.currentText(), self.naming_input.text())
+        resize_spec = (self.resize_combo.currentText(), self.resize_input.value())
         quality = self.jpeg_quality_slider.value()
 
-        total = len(self.image_paths)
-        for idx, p in enumerate(self.image_paths, start=1):
-            try:
-                base = Image.open(p).convert('RGBA')
-                out = self.apply_watermark_to_pil(base)
-
-                # 缩放
-                mode = self.resize_combo.currentText()
-                if mode == '按宽度':
-                    new_w = int(self.resize_input.value())
-                    ratio = new_w / out.width
-                    new_h = int(out.height * ratio)
-                    out = out.resize((new_w, new_h), Image.LANCZOS)
-                elif mode == '按高度':
-                    new_h = int(self.resize_input.value())
-                    ratio = new_h / out.height
-                    new_w = int(out.width * ratio)
-                    out = out.resize((new_w, new_h), Image.LANCZOS)
-                elif mode == '按百分比':
-                    pct = int(self.resize_input.value())
-                    new_w = int(out.width * pct / 100.0)
-                    new_h = int(out.height * pct / 100.0)
-                    out = out.resize((new_w, new_h), Image.LANCZOS)
-
-                # 命名
-                base_name = os.path.basename(p)
-                name, ext = os.path.splitext(base_name)
-                if naming.startswith('保留'):
-                    new_name = name + ext
-                elif naming.startswith('添加前缀'):
-                    new_name = add + name + ext
-                else:
-                    new_name = name + add + ext
-
-                # 输出路径
-                out_path = os.path.join(self.output_folder, new_name)
-                # 如果输出是 jpg/jpeg，需要合并 alpha 背景
-                if ext.lower() in ('.jpg', '.jpeg'):
-                    bg = Image.new('RGB', (out.width, out.height), (255, 255, 255))
-                    bg.paste(out, mask=out.split()[3])
-                    bg.save(out_path, quality=quality)
-                else:
-                    out.save(out_path)
-                print(f'导出: {out_path} ({idx}/{total})')
-            except Exception as e:
-                print('导出失败', p, e)
+        # 在后台线程中调度进程池，避免阻塞界面；模板按值传给子进程
+        self.export_worker = ExportWorker(self.image_paths, self._gather_template(), resize_spec,
+                                          naming, quality, self.output_folder, self)
+        self.export_worker.progress.connect(self.on_export_progress)
+        self.export_worker.failed.connect(self.on_export_failed)
+        self.export_worker.finished.connect(self.on_export_finished)
+        self.export_worker.start()
+
+    def on_export_progress(self, idx, total, out_path):
+        print(f'导出: {out_path} ({idx}/{total})')
+
+    def on_export_failed(self, path, error):
+        print('导出失败', path, error)
+
+    def on_export_finished(self):
+        total = len(self.export_worker.paths)
         QMessageBox.information(self, '导出完成', f'已导出 {total} 张图片到 {self.output_folder}')
 
+    def closeEvent(self, event: QCloseEvent):
+        # 导出线程仍在运行时直接销毁窗口会导致 QThread 被销毁而崩溃，需先取消并等待其结束
+        if self.export_worker is not None and self.export_worker.isRunning():
+            reply = QMessageBox.question(self, '正在导出', '导出尚未完成，是否取消导出并退出？',
+                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply != QMessageBox.Yes:
+                event.ignore()
+                return
+            self.export_worker.blockSignals(True)  # 窗口即将关闭，不再处理进度和完成提示
+            self.export_worker.cancel()
+            self.export_worker.wait()
+        super().closeEvent(event)
+
 
 # -------------------- 运行 --------------------
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # 打包成 exe 后进程池需要
     app = QApplication(sys.argv)
     w = Watermarker()
     w.show()